@@ -0,0 +1,25 @@
+import time
+import statistics
+import bcrypt
+from .settings import get_settings
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int = 10, max_rounds: int = 14) -> int:
+    """Highest bcrypt cost whose median hash time on this CPU stays within target_ms"""
+    rounds = min_rounds
+    for cost in range(min_rounds, max_rounds + 1):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+            timings.append((time.perf_counter() - start) * 1000)
+        if statistics.median(timings) > target_ms:
+            break
+        rounds = cost
+    return rounds
+
+
+if __name__ == "__main__":
+    # Run once before the workers start (see Dockerfile) and exported as BCRYPT_COST, so every
+    # worker uses the same cost instead of calibrating while the others compete for the CPU
+    print(calibrate_bcrypt_rounds(get_settings().bcrypt_target_ms))
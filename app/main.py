@@ -1,24 +1,37 @@
 import os
-import psycopg
+import time
+import asyncio
+import hashlib
+import logging
+import concurrent.futures
 import bcrypt
+import jwt
+import orjson
+import psycopg
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
 from psycopg.rows import dict_row
-from dotenv import load_dotenv
-from pydantic import BaseModel
-
-load_dotenv(override=True)
+from psycopg.types.numeric import FloatLoader
+from psycopg_pool import AsyncConnectionPool
+from pydantic import BaseModel, ConfigDict, Field
+from .bcrypt_cost import calibrate_bcrypt_rounds
+from .settings import get_settings
 
-# CONFIGURATION
-DATABASE_URL = os.getenv("DATABASE_URL", "").strip().strip("'").strip('"')
-SECRET_KEY = os.getenv("JWT_SECRET", "default-secret-key-for-local-dev")
+# CONFIGURATION (see settings.py)
+settings = get_settings()
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Precomputed once so issuing and checking tokens doesn't rebuild them per request
+_SECRET_KEY = settings.jwt_secret.encode()
+_TOKEN_EXPIRY = timedelta(minutes=settings.access_token_expire_minutes)
 
-app = FastAPI()
+logging.basicConfig(level=settings.log_level)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
 # --- MODELS (Fixed to match DB Schema) ---
@@ -32,37 +45,142 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class OrderItem(BaseModel):
+    # Strict, so true/"1" aren't coerced into ids or quantities
+    model_config = ConfigDict(strict=True)
+
+    product_id: int
+    # A negative quantity would pass the stock check and put stock back
+    quantity: int = Field(gt=0)
+
 # DATABASE & AUTH UTILS
-def get_conn():
-    return psycopg.connect(DATABASE_URL, autocommit=True, row_factory=dict_row)
+# Load NUMERIC columns (prices) straight into floats, instead of casting ::FLOAT in every query
+psycopg.adapters.register_loader("numeric", FloatLoader)
+
+# One pool per worker: connections (and their TLS handshake) are reused across requests.
+# psycopg prepares a query server-side from its second execution on, so repeat calls skip
+# parse and plan. These are protocol-level prepares, which PgBouncer tracks across
+# transaction-mode connections once MAX_PREPARED_STATEMENTS is set (see docker-compose.yml)
+pool = AsyncConnectionPool(
+    settings.database_url,
+    min_size=5,
+    max_size=20,
+    kwargs={"autocommit": True, "row_factory": dict_row, "prepare_threshold": 1},
+    open=False,
+)
+
+@app.on_event("startup")
+async def open_pool():
+    await pool.open()
+    await pool.wait()
+    await load_category_names()
+
+@app.on_event("shutdown")
+async def close_pool():
+    await pool.close()
+
+# Rows are encoded in batches so a large result isn't sent one tiny chunk per row
+STREAM_BATCH_ROWS = 500
+
+async def stream_json_array(query: str, params=()):
+    """Yield the rows of query as a JSON array without buffering the whole result set"""
+    async with pool.connection() as conn, conn.cursor() as cur:
+        prefix, batch = b"[", []
+        async for row in cur.stream(query, params):
+            batch.append(orjson.dumps(row))
+            if len(batch) == STREAM_BATCH_ROWS:
+                yield prefix + b",".join(batch)
+                prefix, batch = b",", []
+        if batch:
+            yield prefix + b",".join(batch)
+            prefix = b","
+        yield b"[]" if prefix == b"[" else b"]"
+
+async def stream_rows(query: str, params=()):
+    """Streaming response for query. The first chunk is read before responding, so a pool
+    timeout or failing query still gets an error status instead of a cut-off 200"""
+    chunks = stream_json_array(query, params)
+    first = await anext(chunks)
 
-def hash_password(password: str):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    async def body():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Hands the connection back even if the client goes away mid-stream
+            await chunks.aclose()
 
-def verify_password(plain, hashed):
+    return StreamingResponse(body(), media_type="application/json")
+
+async def fetch_returned_rows(cur):
+    """First row of every result set left by executemany(..., returning=True), None where empty"""
+    rows = []
+    while True:
+        rows.append(await cur.fetchone())
+        if not cur.nextset():
+            return rows
+
+def etag_response(request: Request, payload: bytes, cache_control: str):
+    """JSON response with an ETag, or an empty 304 when the client already holds this payload"""
+    etag = '"' + hashlib.blake2b(payload, digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(payload, media_type="application/json", headers=headers)
+
+# The Dockerfile calibrates once at container start and pins BCRYPT_COST for all workers.
+# Without it, each process calibrates at import (and again on every --reload)
+_BCRYPT_ROUNDS = settings.bcrypt_cost or calibrate_bcrypt_rounds(settings.bcrypt_target_ms)
+
+# bcrypt releases the GIL, so hashing on these threads runs in parallel and keeps the event loop free
+_BCRYPT_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+
+async def hash_password(password: str):
+    hashed = await asyncio.get_running_loop().run_in_executor(
+        _BCRYPT_POOL, bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(_BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+async def verify_password(plain, hashed):
     if not hashed: return False
-    return bcrypt.checkpw(plain.encode('utf-8'), hashed.encode('utf-8'))
+    return await asyncio.get_running_loop().run_in_executor(
+        _BCRYPT_POOL, bcrypt.checkpw, plain.encode('utf-8'), hashed.encode('utf-8'))
 
 def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode = {**data, "exp": datetime.utcnow() + _TOKEN_EXPIRY}
+    return jwt.encode(to_encode, _SECRET_KEY, algorithm=ALGORITHM)
+
+# Users resolved from a token, keyed by a digest of it. Entries live at most 60s and never
+# past the token's expiry. Each worker keeps its own cache, and all access happens on the
+# event loop thread, so no lock is needed
+_USER_CACHE = TTLCache(maxsize=10_000, ttl=60)
+
+def forget_user(customer_id: int):
+    for key, (user, _) in list(_USER_CACHE.items()):
+        if user["customer_id"] == customer_id:
+            _USER_CACHE.pop(key, None)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     fail = HTTPException(status_code=401, detail="Invalid session")
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _USER_CACHE.get(cache_key)
+    if cached and cached[1] > time.time():
+        return cached[0]
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
         email: str = payload.get("sub")
         if not email: raise fail
-    except JWTError: raise fail
+    except jwt.PyJWTError: raise fail
     
-    with get_conn() as conn, conn.cursor() as cur:
-        # FIXED: Select first_name/last_name instead of 'name'
-        cur.execute("SELECT customer_id, first_name, last_name, email, role FROM customers WHERE email = %s", (email,))
-        user = cur.fetchone()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        # Only the id and role are ever read from the current user
+        await cur.execute("SELECT customer_id, role FROM customers WHERE email = %s", (email,))
+        user = await cur.fetchone()
         if not user: raise fail
-        return user
+
+    _USER_CACHE[cache_key] = (user, payload["exp"])
+    return user
 
 def check_admin(user=Depends(get_current_user)):
     # Handle case where role might be None by defaulting to 'customer'
@@ -72,86 +190,200 @@ def check_admin(user=Depends(get_current_user)):
 
 # --- 1. AUTH ENDPOINTS ---
 
+# Upper bound on items per bulk request: a batch holds its row locks and bcrypt threads
+# until it completes
+MAX_BULK_SIZE = 100
+
+def check_bulk_size(items: list):
+    if len(items) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=400, detail=f"Bulk requests are limited to {MAX_BULK_SIZE} items")
+
+# Shared by single and bulk registration
+REGISTER_USER_QUERY = """
+    INSERT INTO customers (first_name, last_name, email, password, role) 
+    VALUES (%s, %s, %s, %s, 'customer') 
+    RETURNING customer_id
+"""
+
 @app.post("/users", status_code=201)
-def register_user(user: UserRegister):
+async def register_user(user: UserRegister):
     """Everyone can create a new user"""
-    hashed = hash_password(user.password)
+    hashed = await hash_password(user.password)
     try:
-        with get_conn() as conn, conn.cursor() as cur:
+        async with pool.connection() as conn, conn.cursor() as cur:
             # FIXED: Insert into first_name and last_name
-            cur.execute(
-                """
-                INSERT INTO customers (first_name, last_name, email, password, role) 
-                VALUES (%s, %s, %s, %s, 'customer') 
-                RETURNING customer_id
-                """,
-                (user.first_name, user.last_name, user.email, hashed)
-            )
-            return {"id": cur.fetchone()["customer_id"], "message": "User registered successfully"}
-    except Exception as e:
-        # Added print so you can see the error in Docker logs
-        print(f"REGISTER ERROR: {e}")
+            await cur.execute(REGISTER_USER_QUERY, (user.first_name, user.last_name, user.email, hashed))
+            return {"id": (await cur.fetchone())["customer_id"], "message": "User registered successfully"}
+    except psycopg.errors.UniqueViolation as e:
+        # An existing email is routine; set LOG_LEVEL=DEBUG to see it in Docker logs
+        logger.debug("REGISTER ERROR: %s", e)
+        raise HTTPException(status_code=400, detail="Registration failed (Email likely exists or DB error)")
+    except Exception:
+        logger.exception("REGISTER ERROR")
+        raise HTTPException(status_code=400, detail="Registration failed (Email likely exists or DB error)")
+
+@app.post("/users/bulk", status_code=201, dependencies=[Depends(check_admin)])
+async def register_users_bulk(users: list[UserRegister]):
+    """Admin only: create many users in one batch, all or nothing"""
+    if not users:
+        return {"ids": [], "message": "No users to register"}
+    check_bulk_size(users)
+    hashes = await asyncio.gather(*(hash_password(u.password) for u in users))
+    params = [(u.first_name, u.last_name, u.email, h) for u, h in zip(users, hashes)]
+    try:
+        async with pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+            # executemany pipelines the inserts: one round trip for the whole batch
+            await cur.executemany(REGISTER_USER_QUERY, params, returning=True)
+            ids = await fetch_returned_rows(cur)
+    except psycopg.errors.UniqueViolation as e:
+        logger.debug("BULK REGISTER ERROR: %s", e)
         raise HTTPException(status_code=400, detail="Registration failed (Email likely exists or DB error)")
+    except Exception:
+        logger.exception("BULK REGISTER ERROR")
+        raise HTTPException(status_code=400, detail="Registration failed (Email likely exists or DB error)")
+    return {"ids": [row["customer_id"] for row in ids], "message": f"{len(ids)} users registered successfully"}
 
 @app.post("/users/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute("SELECT email, password FROM customers WHERE email = %s", (form_data.username,))
-        user = cur.fetchone()
-        if not user or not verify_password(form_data.password, user["password"]):
-            raise HTTPException(status_code=401, detail="Incorrect email or password")
-        
-        token = create_access_token(data={"sub": user["email"]})
-        return {"access_token": token, "token_type": "bearer"}
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT password FROM customers WHERE email = %s", (form_data.username,))
+        user = await cur.fetchone()
+
+    # Checked after the connection is handed back so it isn't held during hashing
+    if not user or not await verify_password(form_data.password, user["password"]):
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+
+    token = create_access_token(data={"sub": form_data.username})
+    return {"access_token": token, "token_type": "bearer"}
 
 # --- 2. PRODUCT ENDPOINTS ---
 
+# Serialized product pages keyed by (after, limit), dropped whenever an order changes stock.
+# Like _USER_CACHE this is per worker, so other workers can serve stock figures up to 60s old
+_PRODUCTS_CACHE = TTLCache(maxsize=256, ttl=60)
+# Bumped on every invalidation, so a page read before an order isn't cached after it
+_products_generation = 0
+
+def invalidate_products():
+    global _products_generation
+    _products_generation += 1
+    _PRODUCTS_CACHE.clear()
+
+# There are only a handful of categories, so names are kept in memory instead of joined
+_CATEGORY_NAMES: dict[int, str] = {}
+
+async def load_category_names():
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT category_id, name FROM categories")
+        rows = await cur.fetchall()
+    _CATEGORY_NAMES.clear()
+    _CATEGORY_NAMES.update((row["category_id"], row["name"]) for row in rows)
+
 @app.get("/products")
-def list_products():
-    """Everyone can list products"""
+async def list_products(request: Request, after: int = 0, limit: int = Query(100, ge=1, le=1000)):
+    """Everyone can list products, a page at a time: pass the last product_id seen as `after`"""
+    payload = _PRODUCTS_CACHE.get((after, limit))
+    if payload is None:
+        generation = _products_generation
+        payload = await fetch_products(after, limit)
+        if generation == _products_generation:
+            _PRODUCTS_CACHE[(after, limit)] = payload
+    # Browsers and CDNs may reuse the listing for a minute and revalidate it with If-None-Match
+    return etag_response(request, payload, "public, max-age=60, stale-while-revalidate=300")
+
+async def fetch_products(after: int, limit: int):
     query = """
-        SELECT p.product_id, p.name, c.name as category_name, p.price::FLOAT, p.stock
-        FROM products p JOIN categories c ON p.category_id = c.category_id
-        ORDER BY p.product_id;
+        SELECT product_id, name, category_id, price, stock
+        FROM products WHERE product_id > %s
+        ORDER BY product_id LIMIT %s;
     """
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(query)
-        return cur.fetchall()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(query, (after, limit))
+        products = await cur.fetchall()
+
+    # A category added since startup shows up as a miss, so reload the names once
+    if any(p["category_id"] is not None and p["category_id"] not in _CATEGORY_NAMES for p in products):
+        await load_category_names()
+    for p in products:
+        p["category_name"] = _CATEGORY_NAMES.get(p.pop("category_id"))
+    return orjson.dumps(products)
 
 # --- 3. ORDER ENDPOINTS ---
 
+# Stock check, decrement and order creation in one statement: a single round trip,
+# and the conditional UPDATE means concurrent orders can never oversell
+PLACE_ORDER_QUERY = """
+    WITH upd AS (
+        UPDATE products SET stock = stock - %(quantity)s
+        WHERE product_id = %(product_id)s AND stock >= %(quantity)s
+        RETURNING name, price
+    ),
+    o AS (
+        INSERT INTO orders (customer_id) SELECT %(customer_id)s FROM upd RETURNING order_id
+    ),
+    i AS (
+        INSERT INTO order_items (order_id, product_id, quantity)
+        SELECT o.order_id, %(product_id)s, %(quantity)s FROM o RETURNING order_id
+    )
+    SELECT i.order_id, upd.name, upd.price FROM i, upd;
+"""
+
+def order_params(item: OrderItem, customer_id: int):
+    return {"product_id": item.product_id, "quantity": item.quantity, "customer_id": customer_id}
+
 @app.post("/orders", status_code=201)
-def place_order(data: dict, current_user=Depends(get_current_user)):
+async def place_order(item: OrderItem, current_user=Depends(get_current_user)):
     """Logged in customers can place orders"""
-    product_id = data.get("product_id")
-    quantity = data.get("quantity")
-    
     # Security: Get ID from the logged-in user, not the request body
-    customer_id = current_user["customer_id"]
-
-    with get_conn() as conn, conn.cursor() as cur:
-        # Check stock and get price
-        cur.execute("SELECT name, price::float, stock FROM products WHERE product_id = %s", (product_id,))
-        product = cur.fetchone()
-        if not product or product["stock"] < quantity:
+    params = order_params(item, current_user["customer_id"])
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(PLACE_ORDER_QUERY, params)
+        order = await cur.fetchone()
+        if not order:
             raise HTTPException(status_code=400, detail="Invalid product or insufficient stock")
 
-        # Atomic order creation
-        cur.execute("INSERT INTO orders (customer_id) VALUES (%s) RETURNING order_id;", (customer_id,))
-        order_id = cur.fetchone()["order_id"]
-        cur.execute("INSERT INTO order_items (order_id, product_id, quantity) VALUES (%s, %s, %s)",
-                    (order_id, product_id, quantity))
-        cur.execute("UPDATE products SET stock = stock - %s WHERE product_id = %s", (quantity, product_id))
+        invalidate_products()
 
         return {
-            "order_id": order_id,
-            "product_name": product["name"],
-            "total_price": product["price"] * quantity,
+            "order_id": order["order_id"],
+            "product_name": order["name"],
+            "total_price": order["price"] * params["quantity"],
             "message": "Order placed successfully"
         }
 
+@app.post("/orders/bulk", status_code=201)
+async def place_orders_bulk(items: list[OrderItem], current_user=Depends(get_current_user)):
+    """Logged in customers can place several orders at once, all or nothing"""
+    if not items:
+        return []
+    check_bulk_size(items)
+    params = [order_params(item, current_user["customer_id"]) for item in items]
+    # Lock products in product_id order, so two batches naming the same products in a
+    # different order can't deadlock; results are mapped back to the request order
+    lock_order = sorted(range(len(params)), key=lambda i: params[i]["product_id"])
+    orders = [None] * len(params)
+    async with pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
+        # executemany pipelines the orders: one round trip for the whole batch. Raising
+        # below rolls back every order in it
+        await cur.executemany(PLACE_ORDER_QUERY, [params[i] for i in lock_order], returning=True)
+        for i, order in zip(lock_order, await fetch_returned_rows(cur)):
+            orders[i] = order
+        if not all(orders):
+            raise HTTPException(status_code=400, detail="Invalid product or insufficient stock")
+
+    invalidate_products()
+
+    return [
+        {
+            "order_id": order["order_id"],
+            "product_name": order["name"],
+            "total_price": order["price"] * p["quantity"],
+        }
+        for order, p in zip(orders, params)
+    ]
+
 @app.get("/orders")
-def get_my_orders(current_user=Depends(get_current_user)):
+async def get_my_orders(current_user=Depends(get_current_user)):
     """Logged in customers can list their own past orders"""
     query = """
         SELECT o.order_id, oi.product_id, oi.quantity 
@@ -159,38 +391,32 @@ def get_my_orders(current_user=Depends(get_current_user)):
         JOIN order_items oi ON o.order_id = oi.order_id 
         WHERE o.customer_id = %s
     """
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(query, (current_user["customer_id"],))
-        return cur.fetchall()
+    return await stream_rows(query, (current_user["customer_id"],))
 
 # --- 4. STATISTICS & ADMIN ENDPOINTS ---
 
 @app.get("/statistics/products", dependencies=[Depends(check_admin)])
-def get_product_stats():
+async def get_product_stats(limit: Optional[int] = Query(None, ge=1)):
     """Admin only: aggregated product data"""
+    # Served from a materialized view refreshed by pg_cron (see db/migrate-stats-views.sql)
     query = """
-        SELECT p.name, SUM(oi.quantity) as total_units_sold, SUM(oi.quantity * p.price)::FLOAT as turnover
-        FROM order_items oi JOIN products p ON oi.product_id = p.product_id
-        GROUP BY p.name ORDER BY turnover DESC;
+        SELECT name, total_units_sold, turnover
+        FROM mv_product_stats ORDER BY turnover DESC LIMIT %s;
     """
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(query)
-        return cur.fetchall()
+    return await stream_rows(query, (limit,))
 
 @app.get("/statistics/users", dependencies=[Depends(check_admin)])
-def get_user_stats():
+async def get_user_stats(limit: Optional[int] = Query(None, ge=1)):
     """Admin only: aggregated user data"""
     query = """
-        SELECT o.customer_id, COUNT(DISTINCT o.order_id) as total_orders, SUM(oi.quantity * p.price)::FLOAT as money_spent
-        FROM orders o JOIN order_items oi ON o.order_id = oi.order_id JOIN products p ON oi.product_id = p.product_id
-        GROUP BY o.customer_id ORDER BY money_spent DESC;
+        SELECT customer_id, total_orders, money_spent
+        FROM mv_user_stats ORDER BY money_spent DESC LIMIT %s;
     """
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(query)
-        return cur.fetchall()
+    return await stream_rows(query, (limit,))
 
 @app.delete("/users/{id}", dependencies=[Depends(check_admin)])
-def delete_user(id: int):
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute("DELETE FROM customers WHERE customer_id = %s", (id,))
+async def delete_user(id: int):
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute("DELETE FROM customers WHERE customer_id = %s", (id,))
+        forget_user(id)
         return {"message": f"User {id} deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,38 @@
+from functools import lru_cache
+from typing import Optional
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """App configuration, read from the environment and .env once per process"""
+    model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True, extra="ignore")
+
+    database_url: str = ""
+    jwt_secret: str = "default-secret-key-for-local-dev"
+    access_token_expire_minutes: int = 60
+    # Set BCRYPT_COST to pin the work factor; otherwise it is calibrated against BCRYPT_TARGET_MS
+    bcrypt_cost: Optional[int] = None
+    bcrypt_target_ms: float = 250
+    log_level: str = "INFO"
+
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        # Values in .env win over the environment, as load_dotenv(override=True) did before
+        return init_settings, dotenv_settings, env_settings, file_secret_settings
+
+    @field_validator("database_url")
+    @classmethod
+    def strip_quotes(cls, value: str):
+        # Cloud consoles and .env files often keep the quotes around a pasted URL
+        return value.strip().strip("'").strip('"')
+
+    @field_validator("log_level")
+    @classmethod
+    def upper_log_level(cls, value: str):
+        return value.upper()
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
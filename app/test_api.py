@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import httpx
 import random
 import string
 
@@ -11,7 +12,7 @@ def generate_random_email():
     random_str = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
     return f"user_{random_str}@example.com"
 
-def run_tests():
+async def run_tests():
     print("🚀 STARTING API TESTS...\n")
     
     # --- 1. SETUP USER DATA ---
@@ -19,118 +20,117 @@ def run_tests():
     password = "testpassword123"
     print(f"🔹 Generated Test User: {email} / {password}")
 
-    # --- 2. REGISTER ---
-    print("\n--- 1. Testing Registration (POST /users) ---")
-    url = f"{BASE_URL}/users"
-    print(f"Requested URL: {url}")
-    
-    try:
-        # UPDATED: We now send first_name and last_name to match your new main.py
-        reg_response = requests.post(url, json={
-            "first_name": "Test",
-            "last_name": "User",
-            "email": email,
+    # One client for the whole run, so every request reuses the same keep-alive connections
+    async with httpx.AsyncClient(base_url=BASE_URL) as client:
+
+        # --- 2. REGISTER ---
+        print("\n--- 1. Testing Registration (POST /users) ---")
+        print(f"Requested URL: {BASE_URL}/users")
+        
+        try:
+            # UPDATED: We now send first_name and last_name to match your new main.py
+            reg_response = await client.post("/users", json={
+                "first_name": "Test",
+                "last_name": "User",
+                "email": email,
+                "password": password
+            })
+            print(f"Status: {reg_response.status_code}")
+            print(f"Response: {reg_response.json()}")
+            
+            if reg_response.status_code != 201:
+                print("❌ Registration failed. Stopping tests.")
+                return
+        except httpx.ConnectError:
+            print("❌ CRITICAL: Could not connect to server. Is Docker running?")
+            return
+
+        # --- 3. LOGIN + LIST PRODUCTS (Public) ---
+        # Independent of each other, so both requests are in flight at once
+        print("\n--- 2. Testing Login (POST /users/login) ---")
+        print(f"Requested URL: {BASE_URL}/users/login")
+        print("\n--- 3. Testing List Products (GET /products) ---")
+        print(f"Requested URL: {BASE_URL}/products")
+        
+        # OAuth2 forms use 'data', not 'json', and expect 'username'/'password' fields
+        login_data = {
+            "username": email,
             "password": password
-        })
-        print(f"Status: {reg_response.status_code}")
-        print(f"Response: {reg_response.json()}")
+        }
+        login_response, prod_response = await asyncio.gather(
+            client.post("/users/login", data=login_data),
+            client.get("/products"),
+        )
         
-        if reg_response.status_code != 201:
-            print("❌ Registration failed. Stopping tests.")
+        if login_response.status_code != 200:
+            print(f"❌ Login failed: {login_response.text}")
             return
-    except requests.exceptions.ConnectionError:
-        print("❌ CRITICAL: Could not connect to server. Is Docker running?")
-        return
 
-    # --- 3. LOGIN ---
-    print("\n--- 2. Testing Login (POST /users/login) ---")
-    url = f"{BASE_URL}/users/login"
-    print(f"Requested URL: {url}")
-    
-    # OAuth2 forms use 'data', not 'json', and expect 'username'/'password' fields
-    login_data = {
-        "username": email,
-        "password": password
-    }
-    login_response = requests.post(url, data=login_data)
-    
-    if login_response.status_code != 200:
-        print(f"❌ Login failed: {login_response.text}")
-        return
+        token_data = login_response.json()
+        access_token = token_data["access_token"]
+        print(f"✅ Login Successful!")
+        print(f"🔑 Token received: {access_token[:15]}...") # Show first 15 chars only
 
-    token_data = login_response.json()
-    access_token = token_data["access_token"]
-    print(f"✅ Login Successful!")
-    print(f"🔑 Token received: {access_token[:15]}...") # Show first 15 chars only
+        # --- 4. PREPARE AUTH HEADER ---
+        auth_headers = {
+            "Authorization": f"Bearer {access_token}"
+        }
 
-    # --- 4. PREPARE AUTH HEADER ---
-    auth_headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
+        products = prod_response.json()
+        print(f"✅ Found {len(products)} products.")
+        
+        if not products:
+            print("❌ No products found in DB. Did you seed the database?")
+            return
+            
+        first_product_id = products[0]["product_id"]
+        print(f"   Targeting Product ID: {first_product_id} ({products[0]['name']})")
 
-    # --- 5. LIST PRODUCTS (Public) ---
-    print("\n--- 3. Testing List Products (GET /products) ---")
-    url = f"{BASE_URL}/products"
-    print(f"Requested URL: {url}")
-    
-    prod_response = requests.get(url)
-    products = prod_response.json()
-    print(f"✅ Found {len(products)} products.")
-    
-    if not products:
-        print("❌ No products found in DB. Did you seed the database?")
-        return
+        # --- 5. PLACE ORDER (Protected) ---
+        print("\n--- 4. Testing Place Order (POST /orders) ---")
+        print(f"Requested URL: {BASE_URL}/orders")
+        
+        order_payload = {
+            "product_id": first_product_id,
+            "quantity": 1
+        }
+        
+        order_response = await client.post(
+            "/orders", 
+            json=order_payload, 
+            headers=auth_headers
+        )
         
-    first_product_id = products[0]["product_id"]
-    print(f"   Targeting Product ID: {first_product_id} ({products[0]['name']})")
+        print(f"Status: {order_response.status_code}")
+        print(f"Response: {order_response.json()}")
 
-    # --- 6. PLACE ORDER (Protected) ---
-    print("\n--- 4. Testing Place Order (POST /orders) ---")
-    url = f"{BASE_URL}/orders"
-    print(f"Requested URL: {url}")
-    
-    order_payload = {
-        "product_id": first_product_id,
-        "quantity": 1
-    }
-    
-    order_response = requests.post(
-        url, 
-        json=order_payload, 
-        headers=auth_headers
-    )
-    
-    print(f"Status: {order_response.status_code}")
-    print(f"Response: {order_response.json()}")
+        if order_response.status_code == 201:
+            print("✅ Order placed successfully!")
+        else:
+            print("❌ Order failed.")
 
-    if order_response.status_code == 201:
-        print("✅ Order placed successfully!")
-    else:
-        print("❌ Order failed.")
+        # --- 6. CHECK ORDER HISTORY + TEST RBAC (Protected / Admin Only) ---
+        # Both only read, so they run concurrently
+        history_response, admin_response = await asyncio.gather(
+            client.get("/orders", headers=auth_headers),
+            client.get("/statistics/users", headers=auth_headers),
+        )
 
-    # --- 7. CHECK ORDER HISTORY (Protected) ---
-    print("\n--- 5. Testing Order History (GET /orders) ---")
-    url = f"{BASE_URL}/orders"
-    print(f"Requested URL: {url}")
-    
-    history_response = requests.get(url, headers=auth_headers)
-    print(f"Response: {history_response.json()}")
+        print("\n--- 5. Testing Order History (GET /orders) ---")
+        print(f"Requested URL: {BASE_URL}/orders")
+        print(f"Response: {history_response.json()}")
 
-    # --- 8. TEST RBAC (Admin Only) ---
-    print("\n--- 6. Testing Admin Access as Customer (Should Fail) ---")
-    url = f"{BASE_URL}/statistics/users"
-    print(f"Requested URL: {url}")
-    
-    admin_response = requests.get(url, headers=auth_headers)
-    print(f"Status: {admin_response.status_code}")
-    # print(f"Response: {admin_response.json()}") # Uncomment if you want to see the 403 detail
-    
-    if admin_response.status_code == 403:
-        print("✅ Correctly blocked! (403 Forbidden)")
-    elif admin_response.status_code == 200:
-        print("❌ WARNING: Customer was allowed to access Admin route!")
-    else:
-        print(f"❓ Unexpected status: {admin_response.status_code}")
+        print("\n--- 6. Testing Admin Access as Customer (Should Fail) ---")
+        print(f"Requested URL: {BASE_URL}/statistics/users")
+        print(f"Status: {admin_response.status_code}")
+        # print(f"Response: {admin_response.json()}") # Uncomment if you want to see the 403 detail
+        
+        if admin_response.status_code == 403:
+            print("✅ Correctly blocked! (403 Forbidden)")
+        elif admin_response.status_code == 200:
+            print("❌ WARNING: Customer was allowed to access Admin route!")
+        else:
+            print(f"❓ Unexpected status: {admin_response.status_code}")
 
 if __name__ == "__main__":
-    run_tests()
\ No newline at end of file
+    asyncio.run(run_tests())
\ No newline at end of file
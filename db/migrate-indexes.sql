@@ -0,0 +1,18 @@
+-- ============================
+-- CREATE INDEXES
+--
+-- NOTE: Run this after migrate-schema.sql. CONCURRENTLY cannot run inside a
+-- transaction block, so execute the statements one at a time (e.g. with psql).
+-- ============================
+
+-- Order Items (join to orders, covers the columns read by /orders and /statistics/users)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_items_order_id_idx
+    ON order_items (order_id) INCLUDE (product_id, quantity);
+
+-- Order Items (join to products, covers the columns read by /statistics/products)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_items_product_id_idx
+    ON order_items (product_id) INCLUDE (order_id, quantity);
+
+-- Orders (lookup of a customer's orders for /orders)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_customer_id_idx
+    ON orders (customer_id) INCLUDE (order_id);
@@ -55,4 +55,21 @@ ALTER TABLE customers ADD COLUMN IF NOT EXISTS email VARCHAR UNIQUE NOT NULL;
 ALTER TABLE orders ADD COLUMN IF NOT EXISTS order_date DATE DEFAULT CURRENT_DATE;
 
 -- Order Items
-ALTER TABLE order_items ADD COLUMN IF NOT EXISTS quantity INT NOT NULL;
\ No newline at end of file
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS quantity INT NOT NULL;
+
+-- ============================
+-- Constraints
+-- ============================
+
+-- Backstop against overselling: no writer may take stock below zero or order nothing
+DO $$
+BEGIN
+    ALTER TABLE products ADD CONSTRAINT products_stock_non_negative CHECK (stock >= 0);
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+DO $$
+BEGIN
+    ALTER TABLE order_items ADD CONSTRAINT order_items_quantity_positive CHECK (quantity > 0);
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
@@ -0,0 +1,39 @@
+-- ============================
+-- CREATE STATISTICS VIEWS
+--
+-- NOTE: Run this after migrate-schema.sql. The views back /statistics/products and
+-- /statistics/users and are refreshed every 5 minutes by pg_cron, so the admin
+-- statistics can lag new orders by up to that long.
+-- ============================
+
+-- Product statistics
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_product_stats AS
+    SELECT p.product_id, p.name, SUM(oi.quantity) AS total_units_sold,
+           SUM(oi.quantity * p.price)::FLOAT AS turnover
+    FROM order_items oi JOIN products p ON oi.product_id = p.product_id
+    GROUP BY p.product_id, p.name;
+
+-- A unique index is required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS mv_product_stats_product_id_idx ON mv_product_stats (product_id);
+CREATE INDEX IF NOT EXISTS mv_product_stats_turnover_idx ON mv_product_stats (turnover DESC);
+
+-- User statistics
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_user_stats AS
+    SELECT o.customer_id, COUNT(DISTINCT o.order_id) AS total_orders,
+           SUM(oi.quantity * p.price)::FLOAT AS money_spent
+    FROM orders o JOIN order_items oi ON o.order_id = oi.order_id JOIN products p ON oi.product_id = p.product_id
+    GROUP BY o.customer_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_user_stats_customer_id_idx ON mv_user_stats (customer_id);
+CREATE INDEX IF NOT EXISTS mv_user_stats_money_spent_idx ON mv_user_stats (money_spent DESC);
+
+-- ============================
+-- Refresh schedule (requires the pg_cron extension)
+-- ============================
+
+CREATE EXTENSION IF NOT EXISTS pg_cron;
+
+SELECT cron.schedule('refresh-product-stats', '*/5 * * * *',
+    'REFRESH MATERIALIZED VIEW CONCURRENTLY mv_product_stats');
+SELECT cron.schedule('refresh-user-stats', '*/5 * * * *',
+    'REFRESH MATERIALIZED VIEW CONCURRENTLY mv_user_stats');